@@ -1,36 +1,189 @@
 # File: agent_langchain.py
 
 import os
+import asyncio
 import logging
+import functools
 from langchain.agents import initialize_agent, Tool, AgentType
 from langchain_openai import ChatOpenAI
-from report_generator import generate_report_for_query  # Ensure this accepts an extra_instructions parameter
-from openai import OpenAI  # Using OpenAI for dynamic instruction generation
-import io
+from langchain_core.callbacks import BaseCallbackHandler
+from report_generator import build_report_context_async, generate_analysis_report, NO_ARTICLES_MESSAGE, REPORT_ERROR_MESSAGE
+from utilities import create_async_openai_client, openai_client_scope, setup_queue_logging, extract_tags  # Using OpenAI for dynamic instruction generation
+from semantic_cache import SemanticCache, semantic_cached, make_digest
+import queue
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
 
-# Custom logging handler to capture logs for Streamlit
+# Maximum number of log lines kept in memory (older lines are dropped first)
+LOG_BUFFER_LINES = 1000
+
+# Maximum number of streamed LLM tokens buffered for the dashboard
+TOKEN_BUFFER_SIZE = 8192
+
+# Log queue of the agent run executing in the current context (see run_agent)
+_job_log_queue = contextvars.ContextVar("job_log_queue", default=None)
+
+def put_dropping_oldest(q: queue.Queue, item) -> None:
+    """
+    Put an item on a bounded queue; if nobody is consuming it, drop the oldest item to make room.
+    """
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+def drain_queue(q: queue.Queue) -> list:
+    """
+    Remove and return everything currently on the queue without blocking.
+    """
+    items = []
+    while True:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            return items
+
+# Logging filter that tags each record with the log queue of the agent run that emitted it.
+# It runs on the QueueHandler, i.e. in the thread that emits the record, where the run's
+# context is visible. Records logged from loop.run_in_executor threads, which do not copy
+# the context (asyncio.to_thread does), carry no queue and are left out of the panel.
+class JobLogFilter(logging.Filter):
+    def filter(self, record):
+        record.job_log_queue = _job_log_queue.get()
+        return True
+
+# Custom logging handler that pushes each log line to the queue of the run that emitted it
 class StreamlitHandler(logging.Handler):
-    def __init__(self):
-        super().__init__()
-        self.logs = io.StringIO()
-    
     def emit(self, record):
-        msg = self.format(record)
-        self.logs.write(msg + "\n")
+        job_log_queue = getattr(record, "job_log_queue", None)
+        if job_log_queue is not None:
+            put_dropping_oldest(job_log_queue, self.format(record))
+
+# Callback handler that forwards the agent LLM's streamed tokens to a queue
+class QueueCallbackHandler(BaseCallbackHandler):
+    def __init__(self, token_queue: queue.Queue):
+        self.token_queue = token_queue
+    
+    def on_llm_new_token(self, token: str, **kwargs):
+        put_dropping_oldest(self.token_queue, token)
     
-    def get_logs(self):
-        return self.logs.getvalue()
+    def on_llm_end(self, response, **kwargs):
+        # Separate the outputs of consecutive LLM calls (agent reasoning steps)
+        put_dropping_oldest(self.token_queue, "\n\n")
+
+# Raised inside run_agent when its cancel_event is set
+class AgentCancelledError(Exception):
+    pass
+
+def check_cancelled(cancel_event) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise AgentCancelledError("Agent run cancelled.")
+
+# Callback handler that stops the agent between steps once its cancel_event is set
+class CancelCallbackHandler(BaseCallbackHandler):
+    raise_error = True  # Let AgentCancelledError propagate out of the agent
+    
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+    
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        check_cancelled(self.cancel_event)
+    
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        check_cancelled(self.cancel_event)
+    
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        check_cancelled(self.cancel_event)
 
 # Configure logging
 streamlit_handler = StreamlitHandler()
-logging.getLogger().handlers = [streamlit_handler]
-logging.getLogger().setLevel(logging.INFO)
-logging.basicConfig(format="%(message)s")
+streamlit_handler.setFormatter(logging.Formatter("%(message)s"))
+setup_queue_logging(streamlit_handler, filters=[JobLogFilter()])
+
+# Persistent worker threads that run the agent for submit_agent,
+# shared by all dashboard sessions (caps the number of concurrent agent runs)
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+_agent_executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="agent")
+
+# Report generated during the current run_agent call (reset at the start of each run).
+# Thread-local because the agent and its tools are shared by concurrent runs.
+_run_state = threading.local()
+
+# Maximum report characters passed to the agent when asking for the final recommendation
+RECOMMENDATION_CONTEXT_CHARS = 4000
+
+# Separates the report from the final recommendation in run_agent's output
+RECOMMENDATION_HEADING = "\n\n### Final Recommendation\n"
+
+# Reports returned when no real report could be produced; their runs are never cached
+FAILED_REPORTS = (REPORT_ERROR_MESSAGE, NO_ARTICLES_MESSAGE)
+
+def is_failed_output(output: str) -> bool:
+    """
+    Return True if a run_agent output carries one of the FAILED_REPORTS instead of a report.
+    """
+    return output.split(RECOMMENDATION_HEADING, 1)[0] in FAILED_REPORTS
+
+# Cache of completed agent runs keyed by query embedding. The looser threshold lets
+# rephrasings of the same request reuse the stored report and recommendation; the digest
+# of the query's tags keeps queries about different entities (e.g. tickers) apart, and
+# entries expire after PLAN_CACHE_MAX_AGE seconds so time-sensitive answers are refreshed.
+PLAN_CACHE_MAX_AGE = float(os.getenv("PLAN_CACHE_MAX_AGE", str(6 * 3600)))
+plan_cache = SemanticCache("run_agent", threshold=0.9, max_age=PLAN_CACHE_MAX_AGE)
+
+# Number of earlier queries of a session remembered for the agent, and the maximum
+# recommendation characters kept per query
+MEMORY_MAX_QUERIES = 5
+MEMORY_RECOMMENDATION_CHARS = 500
+
+def remember_run(memory: dict, query: str, final_answer: str) -> None:
+    """
+    Record a finished query and its recommendation in a session memory dict.
+    This is the only place run_agent writes to the memory; the oldest entries are dropped
+    beyond MEMORY_MAX_QUERIES.
+    """
+    recent = memory.setdefault("recent_queries", [])
+    recent.append({"query": query, "recommendation": final_answer[:MEMORY_RECOMMENDATION_CHARS]})
+    del recent[:-MEMORY_MAX_QUERIES]
 
-# Global variable for report output
-last_tool_output = None
+def format_memory(memory: dict) -> str:
+    """
+    Format the session memory as prompt context, or return an empty string if there is none.
+    """
+    recent = (memory or {}).get("recent_queries", [])
+    if not recent:
+        return ""
+    history = "\n".join(f"- {entry['query']}: {entry['recommendation']}" for entry in recent)
+    return f"Earlier queries in this session and their recommendations:\n{history}\n\n"
+
+# Fallback instructions used for short queries or when GPT-4o cannot be reached
+DEFAULT_INSTRUCTIONS = (
+    "Please provide a detailed analysis focused on the technical and contextual aspects of the query. "
+    "Include relevant background information and actionable insights."
+)
 
-def generate_dynamic_instructions(query: str) -> str:
+# Queries with fewer words than this use DEFAULT_INSTRUCTIONS without an LLM call
+MIN_INSTRUCTION_QUERY_WORDS = 6
+
+async def generate_dynamic_instructions(query: str, client=None) -> str:
+    """
+    Returns additional prompt instructions for a given query.
+    Short queries get DEFAULT_INSTRUCTIONS directly; longer ones are generated by GPT-4o,
+    with repeated and near-duplicate queries answered from the semantic cache.
+    """
+    if len(query.split()) < MIN_INSTRUCTION_QUERY_WORDS:
+        logging.info("Short query, using default report instructions.")
+        return DEFAULT_INSTRUCTIONS
+    return await _generate_dynamic_instructions(query, client=client)
+
+@semantic_cached(threshold=0.95, skip={DEFAULT_INSTRUCTIONS}, exclude={"client"})
+async def _generate_dynamic_instructions(query: str, client=None) -> str:
     """
     Uses GPT-4o to generate additional prompt instructions for a given query.
     The instructions should be research-oriented and domain-specific.
@@ -41,44 +194,55 @@ def generate_dynamic_instructions(query: str) -> str:
         f"guidelines that would help generate a comprehensive report. Query: '{query}'"
     )
     try:
-        # Initialize an OpenAI client using the same API key and project settings
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), project="proj_q0KFYLlNxkE81QCA7dmJjacF")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a professional data analyst specialized in generating research-oriented report guidelines."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=150
-        )
+        async with openai_client_scope(client) as client:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": "You are a professional data analyst specialized in generating research-oriented report guidelines."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=150
+            )
         instructions = response.choices[0].message.content.strip()
         logging.info("Dynamic instructions generated: " + instructions)
         return instructions
     except Exception as e:
         logging.error("Error generating dynamic instructions: " + str(e))
         # Fallback: return a generic instruction string
-        return (
-            "Please provide a detailed analysis focused on the technical and contextual aspects of the query. "
-            "Include relevant background information and actionable insights."
+        return DEFAULT_INSTRUCTIONS
+
+async def generate_report_async(query: str, tags=None) -> str:
+    """
+    Generates the dynamic instructions and gathers the article context concurrently,
+    then produces the analysis report from both. `tags` are the query's precomputed tags.
+    """
+    # One OpenAI client per run, closed before the event loop ends
+    async with create_async_openai_client() as client:
+        extra_instructions, context = await asyncio.gather(
+            generate_dynamic_instructions(query, client=client),
+            build_report_context_async(query, tags=tags)
         )
+        if not context:
+            return NO_ARTICLES_MESSAGE
+        return await generate_analysis_report(context, query, extra_instructions, client=client)
 
-def generate_report_tool(query: str) -> str:
+def generate_report_tool(query: str, tags=None) -> str:
     """
     Tool function that wraps our report generation logic.
     It takes a natural language query, dynamically generates additional prompt instructions,
     and returns a comprehensive analysis report.
+    The report is generated at most once per run_agent call; later calls return it again.
     """
+    last_tool_output = getattr(_run_state, "last_tool_output", None)
+    if last_tool_output is not None:
+        return last_tool_output
+
     logging.info("Generating report for query: " + query)
     
-    # Generate extra instructions dynamically using GPT-4o
-    extra_instructions = generate_dynamic_instructions(query)
-    
-    # Call the report generation function with the extra instructions.
-    report = generate_report_for_query(query, extra_instructions=extra_instructions)
-
-    global last_tool_output
-    last_tool_output = report
+    # Instruction generation overlaps with article fetching and summarization
+    report = asyncio.run(generate_report_async(query, tags))
+    _run_state.last_tool_output = report
 
     return report
 
@@ -99,48 +263,113 @@ tools = [
 ]
 
 
-
-
-def run_agent(query: str) -> str:
+def build_agent():
     """
-    Sets up the LangChain agent and runs it for the given query.
-    Returns the agent's response (the generated report).
+    Build the LangChain agent (ChatOpenAI model, tools and ZERO_SHOT_REACT prompt).
     """
-    global last_tool_output
-    streamlit_handler.logs.truncate(0)  # Clear previous logs
-    streamlit_handler.logs.seek(0)
-
     # Set up the ChatOpenAI model with appropriate API key.
+    # Tokens are streamed to the callbacks passed to each run (see run_agent).
     llm = ChatOpenAI(
         temperature=0.7,
         model_name="gpt-4o",  # Adjust as needed.
-        openai_api_key=os.environ.get("OPENAI_API_KEY")
+        openai_api_key=os.environ.get("OPENAI_API_KEY"),
+        streaming=True
     )
     
     # Initialize the LangChain agent using the ZERO_SHOT_REACT_DESCRIPTION agent type.
-    agent = initialize_agent(
+    return initialize_agent(
         tools, 
         llm, 
         agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, 
         verbose=True,
         handle_parsing_errors=True
     )
+
+@functools.lru_cache(maxsize=1)
+def get_agent():
+    """
+    Return the agent shared by all run_agent calls, built on first use.
+    """
+    return build_agent()
+
+def run_agent(query: str, memory: dict = None, cancel_event: threading.Event = None,
+              log_queue: queue.Queue = None, token_queue: queue.Queue = None) -> str:
+    """
+    Generates the report for the query, then runs the LangChain agent on that report
+    to produce a final recommendation.
+    `memory` is an optional session memory dict: earlier queries recorded in it are given
+    to the agent as context, and this query is added to it with remember_run.
+    `cancel_event` is checked between the steps (report, LLM and tool calls); once it is
+    set the run stops with AgentCancelledError.
+    `log_queue` receives the log lines emitted by this run, and `token_queue` the tokens
+    streamed by the agent's LLM.
+    Returns the report followed by the recommendation.
+    """
+    log_queue_token = _job_log_queue.set(log_queue)
+    try:
+        return _run_agent(query, memory, cancel_event, token_queue)
+    finally:
+        # Pool threads are reused by other runs
+        _job_log_queue.reset(log_queue_token)
+
+def _run_agent(query: str, memory: dict, cancel_event: threading.Event, token_queue: queue.Queue) -> str:
+    _run_state.last_tool_output = None
+
+    # Reuse a recent run for the same (or a near-identical) query about the same tags
+    tags = None
+    try:
+        tags = extract_tags(query)
+        tags_digest = make_digest(sorted(tag.lower() for tag in tags))
+        query_embedding = plan_cache.embed(query)
+        cached = plan_cache.lookup(query_embedding, tags_digest)
+    except Exception as e:
+        logging.error("Plan cache unavailable: " + str(e))
+        query_embedding, cached = None, None
+    if cached:
+        logging.info("Plan cache hit, reusing the previous report for a matching query.")
+        if memory is not None:
+            remember_run(memory, query, cached["final_answer"])
+        return f"{cached['report']}{RECOMMENDATION_HEADING}{cached['final_answer']}"
+
+    # Generate the detailed report exactly once, before the agent runs
+    check_cancelled(cancel_event)
+    detailed_report = generate_report_tool(query, tags)
+    check_cancelled(cancel_event)
+
+    # Callbacks are attached per run, since the agent is shared by concurrent runs
+    callbacks = []
+    if cancel_event is not None:
+        callbacks.append(CancelCallbackHandler(cancel_event))
+    if token_queue is not None:
+        callbacks.append(QueueCallbackHandler(token_queue))
     
-    # Run the agent and capture its full response
-    final_answer = agent.run(query)
+    # Ask the agent for a recommendation based on the report already generated
+    final_answer = get_agent().run(
+        f"Query: {query}\n\nGiven this report: {detailed_report[:RECOMMENDATION_CONTEXT_CHARS]}\n\n"
+        f"{format_memory(memory)}"
+        "Produce a final recommendation for the query.",
+        callbacks=callbacks or None
+    )
+    if memory is not None:
+        remember_run(memory, query, final_answer)
     
-    # Explicitly call the report generator tool to get the detailed report
-    detailed_report = last_tool_output if last_tool_output else generate_report_tool(query)
+    if query_embedding is not None and detailed_report not in FAILED_REPORTS:
+        plan_cache.add(query_embedding, {"report": detailed_report, "final_answer": final_answer}, tags_digest)
     
     # Combine the detailed report and final answer
-    combined_output = f"{detailed_report}\n\n### Final Recommendation\n{final_answer}"
+    combined_output = f"{detailed_report}{RECOMMENDATION_HEADING}{final_answer}"
 
     return combined_output
 
 
 
-def get_logs():
-    return streamlit_handler.get_logs()
+def submit_agent(query: str, memory: dict = None, cancel_event: threading.Event = None,
+                 log_queue: queue.Queue = None, token_queue: queue.Queue = None) -> Future:
+    """
+    Start run_agent in the shared worker pool and return the Future of its output.
+    The run's log lines and LLM tokens are published on the given queues as it runs.
+    """
+    return _agent_executor.submit(run_agent, query, memory, cancel_event, log_queue, token_queue)
 
 def main():
     query = input("Enter your query for the agent: ").strip()
@@ -7,6 +7,9 @@ This module provides an integrated flow for:
 3. Cleaning the scraped content and summarizing it using a Hugging Face BART model
 4. Returning a structured output (list of dictionaries) and optionally writing it to file
 
+Internally the articles of one run are carried column-wise in an ArticleBatch
+(urls / raw / summaries lists) and only converted to dictionaries on return.
+
 Usage (importing into your agent orchestrator):
     from get_data_revised import get_data_and_summarize
 
@@ -19,18 +22,26 @@ Usage (importing into your agent orchestrator):
 Each result is a dictionary:
     {
         "url": <url>,
-        "raw_content": <raw scraped content>,
+        "raw_content": <raw scraped content>,  # omitted with include_raw_content=False
         "summary": <summarized text>
     }
 """
 
 import os
 import re
+import glob
 import html
-import requests
-from urllib.parse import quote
+import json
+import asyncio
+import hashlib
+import threading
+import httpx
+from dataclasses import dataclass
+from typing import List, Optional
+from diskcache import Cache
+from urllib.parse import quote, urlparse
 from googlesearch import search
-from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
 import torch
 from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
 from dotenv import load_dotenv
@@ -45,9 +56,39 @@ nltk.download('punkt', quiet=True)
 ###############################
 
 API_KEY = os.getenv("Jina_API_KEY")
-EXCLUDED_DOMAINS = ['youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion.com']
+SERPER_API_KEY = os.getenv("SERPER_API_KEY")
+SERPER_ENDPOINT = "https://google.serper.dev/search"
+EXCLUDED_DOMAINS = ('youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion.com')
 DEBUG = True
 MAX_RETRIES = 2  # For GPU error recovery
+FETCH_CONCURRENCY = 10  # Maximum number of simultaneous Jina requests
+FETCH_TIMEOUT = 15  # Seconds allowed per network operation of a request
+FETCH_RETRIES = 2  # Extra attempts for transient 5xx responses
+JINA_CACHE_DIR = os.path.expanduser(os.getenv("JINA_CACHE_DIR", "~/.cache/report_agent/jina"))
+JINA_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached Jina response expires
+SUMMARY_BATCH_SIZE = 8  # Articles per forward pass in batched summarization
+MAX_INPUT_TOKENS = 1024  # BART's maximum input length
+LENGTH_BUCKETS = (256, 512, MAX_INPUT_TOKENS)  # Upper token bounds of the summarization buckets
+BATCH_MIN_CHARS = 300  # Shorter texts keep per-article dynamic summary lengths
+MODEL_NAME = "facebook/bart-large-cnn"
+# "onnx" runs an int8-quantized ONNX Runtime export on CPU; "torch" keeps the FP32 PyTorch model
+SUMMARIZER_BACKEND = os.getenv("SUMMARIZER_BACKEND", "onnx")
+QUANTIZED_MODEL_DIR = os.path.expanduser(
+    os.getenv("QUANTIZED_MODEL_DIR", "~/.cache/report_agent/bart-large-cnn-int8")
+)
+# Quantized ONNX files the summarizer is loaded from, by ORTModelForSeq2SeqLM argument
+QUANTIZED_FILE_NAMES = {
+    "encoder_file_name": "encoder_model_quantized.onnx",
+    "decoder_file_name": "decoder_model_quantized.onnx",
+    "decoder_with_past_file_name": "decoder_with_past_model_quantized.onnx",
+}
+# Opt-in: fuse attention with BetterTransformer and torch.compile the PyTorch model (slow first start)
+SUMMARIZER_COMPILE = os.getenv("SUMMARIZER_COMPILE", "0") == "1"
+
+# Patterns used by clean_content, compiled once
+MARKDOWN_PATTERN = re.compile(r"!?\[.*?\]\(.*?\)|#{1,6}\s*")  # Markdown images, links and headers
+NEWLINE_PATTERN = re.compile(r"\n+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
 
 ###############################
 # Helper Debug Function
@@ -57,29 +98,99 @@ def debug_print(*args):
     if DEBUG:
         print("[DEBUG]", *args)
 
+###############################
+# Article Batch
+###############################
+
+@dataclass
+class ArticleBatch:
+    """
+    The articles of one run, stored column-wise: urls[i], raw[i] and summaries[i]
+    all describe the same article. Stages fill `raw` and `summaries` in place by index.
+    """
+    urls: List[str]
+    raw: List[Optional[str]]
+    summaries: List[Optional[str]]
+
+    @classmethod
+    def for_urls(cls, urls):
+        return cls(urls=list(urls), raw=[None] * len(urls), summaries=[None] * len(urls))
+
+    def __len__(self):
+        return len(self.urls)
+
+    def to_dicts(self, include_raw_content=True):
+        """
+        Convert to the public list-of-dictionaries format.
+        """
+        results = []
+        for i, url in enumerate(self.urls):
+            entry = {"url": url}
+            if include_raw_content:
+                entry["raw_content"] = self.raw[i]
+            entry["summary"] = self.summaries[i]
+            results.append(entry)
+        return results
+
 ###############################
 # Data Retrieval Functions
 ###############################
 
-def get_urls(query, num_results=7):
+# Disk cache of Jina Reader responses, keyed by a hash of the article URL
+jina_cache = Cache(JINA_CACHE_DIR)
+
+def url_cache_key(url):
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+
+def is_excluded_url(url):
     """
-    Use googlesearch to fetch a list of URLs for the given query,
-    excluding domains from video streaming platforms.
+    Return True if the URL's host is one of EXCLUDED_DOMAINS or a subdomain of one.
     """
-    raw_urls = list(search(query, num_results=num_results * 2))
+    host = (urlparse(url).hostname or "").lower()
+    return any(host == domain or host.endswith("." + domain) for domain in EXCLUDED_DOMAINS)
+
+async def search_serper(session, query, num_results):
+    """
+    Run a Google search through the Serper API and return the organic result links.
+    """
+    headers = {"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"}
+    payload = {"q": query, "num": num_results}
+    response = await session.post(SERPER_ENDPOINT, json=payload, headers=headers)
+    response.raise_for_status()
+    data = response.json()
+    return [result["link"] for result in data.get("organic", []) if result.get("link")]
+
+async def get_urls(session, query, num_results=7):
+    """
+    Fetch a list of URLs for the given query, excluding domains from video streaming platforms.
+    Uses the Serper search API when SERPER_API_KEY is set; otherwise falls back to
+    scraping Google with googlesearch in a worker thread.
+    """
+    if SERPER_API_KEY:
+        raw_urls = await search_serper(session, query, num_results * 2)
+    else:
+        raw_urls = await asyncio.to_thread(lambda: list(search(query, num_results=num_results * 2)))
     filtered_urls = []
     for url in raw_urls:
-        if any(domain in url for domain in EXCLUDED_DOMAINS):
+        if is_excluded_url(url):
             continue
         filtered_urls.append(url)
         if len(filtered_urls) >= num_results:
             break
     return filtered_urls
 
-def get_clean_content(url):
+async def get_clean_content(session, url, semaphore):
     """
     Fetch clean content for a given URL using the Jina Reader API.
+    Responses are served from the disk cache when available (see JINA_CACHE_TTL).
+    Transient 5xx responses are retried with a short exponential backoff.
     """
+    cache_key = url_cache_key(url)
+    cached = jina_cache.get(cache_key)
+    if cached is not None:
+        debug_print(f"Jina cache hit for {url}")
+        return cached
+
     encoded_url = quote(url, safe='')
     api_endpoint = f"https://r.jina.ai/{encoded_url}"
     
@@ -88,44 +199,88 @@ def get_clean_content(url):
     #     "X-Engine": "direct"
     # }
     
-    # response = requests.get(api_endpoint, headers=headers)
-    response = requests.get(api_endpoint)
-    if response.status_code == 200:
-        return response.text
-    else:
-        raise Exception(f"API Error: {response.status_code} - {response.text}")
+    # session.get(api_endpoint, headers=headers)
+    for attempt in range(FETCH_RETRIES + 1):
+        async with semaphore:
+            response = await session.get(api_endpoint)
+        status = response.status_code
+        text = response.text
+        if status == 200:
+            jina_cache.set(cache_key, text, expire=JINA_CACHE_TTL)
+            return text
+        if status >= 500 and attempt < FETCH_RETRIES:
+            debug_print(f"Jina returned {status} for {url}, retrying...")
+            await asyncio.sleep(2 ** attempt)
+            continue
+        raise Exception(f"API Error: {status} - {text}")
 
-def fetch_data(mode="query", query=None, url_list=None, num_results=5):
+def create_session():
     """
-    Fetches data from URLs either by performing a Google search using the provided query,
-    or by using a given list of URLs.
-    
-    Returns a list of dictionaries:
-        [
-            {"url": <url>, "raw_content": <content>},
-            ...
-        ]
+    Create the HTTP/2 client shared by the search and scraping requests of one run.
+    Keep-alive connections are reused across requests, and concurrent requests to the
+    same host are multiplexed over a single TLS session.
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(FETCH_TIMEOUT),
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+
+async def stream_fetch_data(session, urls):
+    """
+    Async generator that fetches all URLs concurrently (capped at FETCH_CONCURRENCY
+    in-flight requests) and yields (index, raw_content) pairs as each response lands.
+    `index` is the URL's position in `urls`; failures yield an "Error: ..." string.
+    """
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def fetch_one(index, url):
+        try:
+            content = await get_clean_content(session, url, semaphore)
+        except Exception as e:
+            debug_print(f"Error processing {url}: {str(e)}")
+            content = f"Error: {str(e)}"
+        return index, content
+
+    tasks = [asyncio.create_task(fetch_one(i, url)) for i, url in enumerate(urls)]
+    for task in asyncio.as_completed(tasks):
+        yield await task
+
+async def resolve_urls(session, mode="query", query=None, url_list=None, num_results=5):
+    """
+    Return the URLs to scrape: search results for `query` in "query" mode,
+    or `url_list` as given in "urls" mode.
     """
-    results = []
     if mode == "query":
         if not query:
             raise ValueError("Query must be provided when mode is 'query'.")
-        urls = get_urls(query, num_results=num_results)
+        return await get_urls(session, query, num_results=num_results)
     elif mode == "urls":
         if not url_list:
             raise ValueError("url_list must be provided when mode is 'urls'.")
-        urls = url_list
+        return url_list
     else:
         raise ValueError("Invalid mode specified. Use 'query' or 'urls'.")
+
+async def _fetch_data_async(mode, query, url_list, num_results):
+    """
+    Resolve and fetch all URLs concurrently into an ArticleBatch.
+    """
+    async with create_session() as session:
+        urls = await resolve_urls(session, mode=mode, query=query, url_list=url_list, num_results=num_results)
+        batch = ArticleBatch.for_urls(urls)
+        async for index, content in stream_fetch_data(session, urls):
+            batch.raw[index] = content
+    return batch
+
+def fetch_data(mode="query", query=None, url_list=None, num_results=5):
+    """
+    Fetches data from URLs either by performing a Google search using the provided query,
+    or by using a given list of URLs. The URLs are scraped concurrently.
     
-    for url in urls:
-        try:
-            content = get_clean_content(url)
-            results.append({"url": url, "raw_content": content})
-        except Exception as e:
-            debug_print(f"Error processing {url}: {str(e)}")
-            results.append({"url": url, "raw_content": f"Error: {str(e)}"})
-    return results
+    Returns an ArticleBatch with `urls` and `raw` filled in.
+    """
+    return asyncio.run(_fetch_data_async(mode, query, url_list, num_results))
 
 ###############################
 # Summarization Functions
@@ -136,25 +291,96 @@ def clean_content(text):
     Remove HTML/Markdown tags and clean text for summarization.
     """
     text = html.unescape(text)
-    text = BeautifulSoup(text, "html.parser").get_text()
-    text = re.sub(r"!\[.*?\]\(.*?\)", "", text)  # Remove markdown images
-    text = re.sub(r"\[.*?\]\(.*?\)", "", text)    # Remove markdown links
-    text = re.sub(r"#{1,6}\s*", "", text)          # Remove headers
-    text = re.sub(r"\n+", ". ", text)              # Replace newlines with periods
-    text = re.sub(r"\s+", " ", text)               # Remove extra spaces
+    text = HTMLParser(text).text()
+    text = MARKDOWN_PATTERN.sub("", text)      # Remove markdown images, links and headers
+    text = NEWLINE_PATTERN.sub(". ", text)     # Replace newlines with periods
+    text = WHITESPACE_PATTERN.sub(" ", text)   # Remove extra spaces
     return text.strip()
 
+def build_quantized_model(tokenizer):
+    """
+    Export facebook/bart-large-cnn to ONNX and apply dynamic int8 quantization,
+    saving the result to QUANTIZED_MODEL_DIR. Only runs when no cached export exists.
+    """
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    debug_print("Exporting and quantizing model to ONNX (one-time)...")
+    export_dir = os.path.join(QUANTIZED_MODEL_DIR, "fp32")
+    model = ORTModelForSeq2SeqLM.from_pretrained(MODEL_NAME, export=True)
+    model.save_pretrained(export_dir)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    for onnx_path in glob.glob(os.path.join(export_dir, "*.onnx")):
+        quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=os.path.basename(onnx_path))
+        quantizer.quantize(save_dir=QUANTIZED_MODEL_DIR, quantization_config=qconfig)
+    model.config.save_pretrained(QUANTIZED_MODEL_DIR)
+    tokenizer.save_pretrained(QUANTIZED_MODEL_DIR)
+
+def missing_quantized_files():
+    """
+    Return the QUANTIZED_FILE_NAMES not present in QUANTIZED_MODEL_DIR (empty if the export is complete).
+    """
+    return [name for name in QUANTIZED_FILE_NAMES.values()
+            if not os.path.isfile(os.path.join(QUANTIZED_MODEL_DIR, name))]
+
+def load_quantized_model():
+    """
+    Load the int8 ONNX Runtime model from QUANTIZED_MODEL_DIR.
+    """
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    return ORTModelForSeq2SeqLM.from_pretrained(QUANTIZED_MODEL_DIR, **QUANTIZED_FILE_NAMES)
+
+def optimize_torch_model(model):
+    """
+    Apply BetterTransformer attention fusion and torch.compile to a PyTorch model.
+    Each step is skipped (with a debug message) if it is unsupported in this environment.
+    """
+    try:
+        from optimum.bettertransformer import BetterTransformer
+        model = BetterTransformer.transform(model)
+    except Exception as e:
+        debug_print("BetterTransformer unavailable, skipping:", e)
+    try:
+        # Compile forward rather than the module so generate() picks up the compiled graph
+        model.forward = torch.compile(model.forward, mode="reduce-overhead")
+    except Exception as e:
+        debug_print("torch.compile unavailable, skipping:", e)
+    return model
+
 def initialize_model():
     """
     Initialize and return a Hugging Face summarization pipeline using facebook/bart-large-cnn.
+    On CPU (with SUMMARIZER_BACKEND="onnx") the pipeline runs an int8-quantized ONNX Runtime
+    model cached on disk; on CUDA, or if the ONNX path fails, the PyTorch model is used.
     """
     debug_print("Initializing model...")
     try:
-        model = AutoModelForSeq2SeqLM.from_pretrained("facebook/bart-large-cnn")
-        tokenizer = AutoTokenizer.from_pretrained("facebook/bart-large-cnn")
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
         device_str = "cuda:0" if torch.cuda.is_available() else "cpu"
+        if device_str == "cpu" and SUMMARIZER_BACKEND == "onnx":
+            try:
+                # Rebuild unless every quantized file is present (e.g. after a partial export)
+                if missing_quantized_files():
+                    build_quantized_model(tokenizer)
+                    missing = missing_quantized_files()
+                    if missing:
+                        raise RuntimeError(f"quantized export is missing {', '.join(missing)}")
+                from optimum.pipelines import pipeline as ort_pipeline
+                debug_print(f"Loading quantized ONNX model from {QUANTIZED_MODEL_DIR}")
+                return ort_pipeline(
+                    "summarization",
+                    model=load_quantized_model(),
+                    tokenizer=tokenizer,
+                    accelerator="ort",
+                )
+            except Exception as e:
+                print(f"ONNX Runtime initialization failed, using the PyTorch model: {e}")
+        model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
         debug_print(f"Moving model to {device_str}")
         model = model.to(device_str)
+        if SUMMARIZER_COMPILE:
+            model = optimize_torch_model(model)
         device = 0 if device_str.startswith("cuda") else -1
         summarizer = pipeline(
             "summarization",
@@ -162,11 +388,31 @@ def initialize_model():
             tokenizer=tokenizer,
             device=device,
         )
+        if SUMMARIZER_COMPILE:
+            # Warm up on a 512-token dummy input so the first real call doesn't pay compile cost
+            debug_print("Warming up compiled model...")
+            summarizer(" ".join(["warmup"] * 512), max_length=30, min_length=10, truncation=True)
         return summarizer
     except Exception as e:
         debug_print("Model initialization failed:", e)
         raise
 
+# Summarization pipeline shared by all callers, initialized on first use
+_SUMMARIZER = None
+_SUMMARIZER_LOCK = threading.Lock()
+
+def get_summarizer():
+    """
+    Return the process-wide summarization pipeline, initializing it on first use.
+    Concurrent first calls wait for a single initialization (and ONNX export).
+    """
+    global _SUMMARIZER
+    if _SUMMARIZER is None:
+        with _SUMMARIZER_LOCK:
+            if _SUMMARIZER is None:
+                _SUMMARIZER = initialize_model()
+    return _SUMMARIZER
+
 def safe_summarize(summarizer, content):
     """
     Summarize content using the provided summarizer with error recovery.
@@ -175,12 +421,7 @@ def safe_summarize(summarizer, content):
     for attempt in range(MAX_RETRIES):
         try:
             cleaned = clean_content(content)
-            # Tokenize to check input length
-            tokens = summarizer.tokenizer.encode(cleaned, truncation=False, add_special_tokens=False)
-            # If input is very long, truncate to a safe limit (e.g., 1000 tokens)
-            if len(tokens) > 1024:
-                debug_print(f"Truncating content from {len(tokens)} tokens")
-                cleaned = summarizer.tokenizer.decode(tokens[:1000], skip_special_tokens=True)
+            # Over-long inputs are truncated to the model limit by the tokenizer (truncation=True)
             # Set dynamic parameters based on input length
             input_length = len(cleaned)
             if input_length < 50:
@@ -203,36 +444,150 @@ def safe_summarize(summarizer, content):
             raise
     return "Summary error: Maximum retries exceeded"
 
-def process_data_for_summarization(summarizer, data):
+def summarize_batch(summarizer, texts):
     """
-    For each entry in the data list (each a dict with 'url' and 'raw_content'),
-    generate a summary using safe_summarize.
-    
-    Returns a new list of dictionaries with added key 'summary'.
+    Summarize a list of cleaned texts with batched pipeline calls.
+    Texts are grouped into token-length buckets (see LENGTH_BUCKETS) and each bucket
+    is summarized separately, so a short article is never padded to the length of a
+    long one. The returned summaries are in the same order as the input texts.
     """
-    results = []
-    for entry in data:
-        url = entry.get("url", "Unknown URL")
-        raw_content = entry.get("raw_content", "")
+    lengths = [
+        len(ids) for ids in
+        summarizer.tokenizer(texts, truncation=True, max_length=MAX_INPUT_TOKENS)["input_ids"]
+    ]
+    buckets = [[] for _ in LENGTH_BUCKETS]
+    for i in sorted(range(len(texts)), key=lambda i: lengths[i]):
+        bucket = next(b for b, upper in enumerate(LENGTH_BUCKETS) if lengths[i] <= upper)
+        buckets[bucket].append(i)
+
+    summaries = [None] * len(texts)
+    for indices in buckets:
+        if not indices:
+            continue
+        # Pipeline batching pads each batch to its longest sequence
+        outputs = summarizer(
+            [texts[i] for i in indices],
+            batch_size=min(len(indices), SUMMARY_BATCH_SIZE),
+            max_length=150,
+            min_length=30,
+            do_sample=False,
+            truncation=True
+        )
+        for i, output in zip(indices, outputs):
+            summaries[i] = output['summary_text']
+    return summaries
+
+def process_data_for_summarization(summarizer, batch, indices=None):
+    """
+    Summarize the raw content of the articles at `indices` (default: all) in the
+    ArticleBatch, writing each result into batch.summaries in place.
+    Articles are summarized together with summarize_batch; short articles and any
+    batch failure fall back to safe_summarize per article.
+    """
+    if indices is None:
+        indices = range(len(batch))
+    pending, batch_indices, batch_texts = [], [], []
+    for i in indices:
+        raw_content = batch.raw[i] or ""
         if raw_content.startswith("Error:"):
-            summary = raw_content
-        else:
+            batch.summaries[i] = raw_content
+            continue
+        pending.append(i)
+        cleaned = clean_content(raw_content)
+        if len(cleaned) >= BATCH_MIN_CHARS:
+            batch_indices.append(i)
+            batch_texts.append(cleaned)
+    
+    if batch_texts:
+        try:
+            for i, summary in zip(batch_indices, summarize_batch(summarizer, batch_texts)):
+                batch.summaries[i] = summary
+        except Exception as e:
+            debug_print(f"Batched summarization failed, falling back to per-article: {e}")
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+    
+    for i in pending:
+        if batch.summaries[i] is None:
             try:
-                summary = safe_summarize(summarizer, raw_content)
+                batch.summaries[i] = safe_summarize(summarizer, batch.raw[i] or "")
             except Exception as e:
-                summary = f"Summarization failed: {str(e)}"
-        results.append({
-            "url": url,
-            "raw_content": raw_content,
-            "summary": summary
-        })
-    return results
+                batch.summaries[i] = f"Summarization failed: {str(e)}"
+    return batch
 
 ###############################
 # Main Integration Function
 ###############################
 
-def get_data_and_summarize(query=None, url_list=None, num_results=5, output_file=None):
+def write_entry(f, url, summary, as_jsonl=False):
+    """
+    Write one summarized article to an open output file, as a JSON line or as the
+    plain-text block format.
+    """
+    if as_jsonl:
+        json.dump({"url": url, "summary": summary}, f)
+        f.write("\n")
+    else:
+        f.write(f"URL: {url}\n")
+        f.write("-" * 50 + "\n")
+        f.write("Summary:\n")
+        f.write(summary + "\n")
+        f.write("=" * 80 + "\n\n")
+
+async def _fetch_and_summarize_async(mode, query, url_list, num_results, on_summarized=None, keep_raw=True):
+    """
+    Overlap scraping with summarization using a producer-consumer queue.
+
+    The producer pushes entries onto a bounded queue as each fetch completes. The consumer
+    summarizes whatever has arrived (up to SUMMARY_BATCH_SIZE entries) in a worker thread,
+    so later pages keep downloading while earlier ones are summarized. The summarizer
+    itself is initialized in the background while the first pages download.
+
+    `on_summarized(batch, indices)` is called after each group is summarized; with
+    keep_raw=False the raw content of a group is released right after that.
+    """
+    loop = asyncio.get_running_loop()
+    summarizer_future = loop.run_in_executor(None, get_summarizer)
+    queue = asyncio.Queue(maxsize=16)
+
+    async with create_session() as session:
+        urls = await resolve_urls(session, mode=mode, query=query, url_list=url_list, num_results=num_results)
+        batch = ArticleBatch.for_urls(urls)
+
+        async def producer():
+            async for item in stream_fetch_data(session, urls):
+                await queue.put(item)
+            await queue.put(None)
+
+        async def consumer():
+            done = False
+            while not done:
+                indices = []
+                item = await queue.get()
+                while item is not None:
+                    index, content = item
+                    batch.raw[index] = content
+                    indices.append(index)
+                    if len(indices) >= SUMMARY_BATCH_SIZE or queue.empty():
+                        break
+                    item = queue.get_nowait()
+                done = item is None
+                if indices:
+                    summarizer = await summarizer_future
+                    await loop.run_in_executor(
+                        None, process_data_for_summarization, summarizer, batch, indices
+                    )
+                    if on_summarized:
+                        # Output writes run in a worker thread so they never block the event loop
+                        await loop.run_in_executor(None, on_summarized, batch, indices)
+                    if not keep_raw:
+                        for index in indices:
+                            batch.raw[index] = None
+
+        await asyncio.gather(producer(), consumer())
+    return batch
+
+def get_data_and_summarize(query=None, url_list=None, num_results=5, output_file=None, include_raw_content=True):
     """
     Main function to fetch data and summarize it.
     
@@ -240,32 +595,45 @@ def get_data_and_summarize(query=None, url_list=None, num_results=5, output_file
         query (str): A search query to fetch URLs (if provided).
         url_list (list): A list of URLs to process (if provided).
         num_results (int): Number of URLs to fetch when using a query.
-        output_file (str): Optional file path to write the structured output.
+        output_file (str): Optional file path to write the structured output. Entries are
+            written as soon as they are summarized; a ".jsonl" path writes JSON lines.
+        include_raw_content (bool): Whether to include the scraped text in the results.
     
     Returns:
-        results (list): A list of dictionaries with keys: 'url', 'raw_content', 'summary'
+        results (list): A list of dictionaries with keys: 'url', 'raw_content' (optional), 'summary'
     """
     # Determine mode based on parameters
     mode = "query" if query else "urls"
-    data = fetch_data(mode=mode, query=query, url_list=url_list, num_results=num_results)
-    summarizer = initialize_model()
-    results = process_data_for_summarization(summarizer, data)
     
+    # Open the output file up front so each entry is written as soon as it is summarized
+    f = None
     if output_file:
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                # Write structured output as a simple text dump (could be JSON if desired)
-                for entry in results:
-                    f.write(f"URL: {entry['url']}\n")
-                    f.write("-" * 50 + "\n")
-                    f.write("Summary:\n")
-                    f.write(entry['summary'] + "\n")
-                    f.write("=" * 80 + "\n\n")
-            debug_print(f"Results written to {output_file}")
+            f = open(output_file, 'w', encoding='utf-8')
         except Exception as e:
             debug_print(f"Failed to write to {output_file}: {e}")
+    as_jsonl = bool(output_file) and output_file.endswith(".jsonl")
+    
+    def write_summarized(batch, indices):
+        try:
+            for i in indices:
+                write_entry(f, batch.urls[i], batch.summaries[i], as_jsonl)
+            f.flush()
+        except Exception as e:
+            debug_print(f"Failed to write to {output_file}: {e}")
+    
+    try:
+        batch = asyncio.run(_fetch_and_summarize_async(
+            mode, query, url_list, num_results,
+            on_summarized=write_summarized if f else None,
+            keep_raw=include_raw_content
+        ))
+    finally:
+        if f:
+            f.close()
+            debug_print(f"Results written to {output_file}")
     
-    return results
+    return batch.to_dicts(include_raw_content=include_raw_content)
 
 ###############################
 # Optional: Main Block for Testing
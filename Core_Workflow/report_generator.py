@@ -1,19 +1,41 @@
 # File: report_generator.py
 
 import os
+import json
+import asyncio
 import logging
-from typing import List, Dict
+import functools
+import tiktoken
+from typing import List, Dict, Iterator, Optional, Union
 
 # Import our utility functions and data retrieval function
-from utilities import extract_tags, query_database_by_tags, append_articles
+from utilities import extract_tags, extract_tags_batch, query_database_by_tags, append_articles, create_async_openai_client, openai_client_scope, setup_queue_logging
 from get_data_revised import get_data_and_summarize
+from semantic_cache import semantic_cached
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-    
 # Define a threshold for minimum number of articles from the DB
 MIN_ARTICLE_THRESHOLD = 7
 
+# Maximum number of tokens of article summaries sent to GPT-4o per report
+MAX_CONTEXT_TOKENS = 6000
+
+# Static report instructions. Sent first, as the system message, so the prompt prefix is
+# identical across reports and eligible for OpenAI's prompt caching.
+REPORT_SYSTEM_PROMPT = """You are a professional data analyst and an expert at turning information extracted from various reputable sources into reports.
+
+Generate a comprehensive and deeply researched report addressing the user's query, based only on the provided sources. Your report should:
+1. **Executive Summary:** Present a concise overview of the key findings.
+2. **Detailed Analysis:** Provide an in-depth analysis that synthesizes the information, identifies underlying trends, and explains the significance of the data.
+3. **Supplementary Insights:** Offer additional insights such as comparisons with historical data, contextual factors influencing the trends, and potential implications for future decisions.
+4. **Conclusion:** Summarize the overall insights and propose actionable recommendations or considerations.
+
+Ensure that the report is clear, logically organized, and written in a tone appropriate for strategic decision-making rather than journalistic reporting.
+Ensure that the report includes all sections as described and do not shorten the output to only a final summary."""
+
+# Returned when the analysis report cannot be generated (never cached)
+REPORT_ERROR_MESSAGE = "Error generating report."
+NO_ARTICLES_MESSAGE = "No relevant articles found to generate a report."
+
 def supplement_data(query: str, num_results: int = 7) -> List[Dict]:
     """
     Supplement data by fetching additional articles using get_data_and_summarize.
@@ -21,124 +43,221 @@ def supplement_data(query: str, num_results: int = 7) -> List[Dict]:
     """
     logging.info("Supplementing data using get_data_and_summarize...")
     try:
-        results = get_data_and_summarize(query=query, num_results=num_results, output_file=None)
+        # Only url and summary are used downstream, so skip returning the scraped text
+        results = get_data_and_summarize(query=query, num_results=num_results, output_file=None, include_raw_content=False)
         return results
     except Exception as e:
         logging.error("Error supplementing data: " + str(e))
         return []
 
-def collate_article_summaries(articles: List[Dict]) -> str:
+def iter_article_summaries(articles: List[Dict]) -> Iterator[str]:
     """
-    Collate the summaries of the articles into a single context string.
-    Each article's summary is prefixed by its URL for reference.
+    Yield one context block per article with a summary, prefixed by its URL for reference.
     """
-    collated = ""
     for i, article in enumerate(articles):
         summary = article.get("summary", "")
         url = article.get("url", "Unknown URL")
         if summary:
-            collated += f"Article {i+1} (URL: {url}):\n{summary}\n\n"
-    return collated
+            yield f"Article {i+1} (URL: {url}):\n{summary}\n\n"
 
-def generate_analysis_report(context: str, query: str, extra_instructions: str = "") -> str:
-    base_prompt = f"""
-    You are an expert data analyst. Based on the following information extracted from various reputable sources:
-    {context}
+@functools.lru_cache(maxsize=1)
+def get_token_encoding():
+    return tiktoken.encoding_for_model("gpt-4o")
 
-    Generate a comprehensive and deeply researched report addressing the query: "{query}". Your report should:
-    1. **Executive Summary:** Present a concise overview of the key findings.
-    2. **Detailed Analysis:** Provide an in-depth analysis that synthesizes the information, identifies underlying trends, and explains the significance of the data.
-    3. **Supplementary Insights:** Offer additional insights such as comparisons with historical data, contextual factors influencing the trends, and potential implications for future decisions.
-    4. **Conclusion:** Summarize the overall insights and propose actionable recommendations or considerations.
+def collate_article_summaries(articles: List[Dict], max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
+    """
+    Collate the summaries of the articles into a single context string.
+    Each article's summary is prefixed by its URL for reference.
+    Articles are taken in order until the next one would exceed `max_tokens`,
+    so callers should pass the most relevant articles first.
+    """
+    encoding = get_token_encoding()
+    blocks, used_tokens = [], 0
+    for block in iter_article_summaries(articles):
+        block_tokens = len(encoding.encode(block))
+        if used_tokens + block_tokens > max_tokens:
+            logging.info(f"Context token budget reached; using {len(blocks)} article summaries.")
+            break
+        blocks.append(block)
+        used_tokens += block_tokens
+    return "".join(blocks)
 
-    Ensure that the report is clear, logically organized, and written in a tone appropriate for strategic decision-making rather than journalistic reporting.
-    Ensure that the report includes all sections as described and do not shorten the output to only a final summary.
+def build_report_messages(context: str, query: str, extra_instructions: str = "") -> List[Dict]:
     """
+    Build the chat messages for the analysis report request.
+    """
+    prompt = (
+        f"Information extracted from various reputable sources:\n{context}\n"
+        f'Query: "{query}"'
+    )
     # Append any extra instructions if provided
-    prompt = base_prompt + "\n" + extra_instructions if extra_instructions else base_prompt
+    if extra_instructions:
+        prompt += "\n\n" + extra_instructions
+    return [
+        {"role": "system", "content": REPORT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
+@semantic_cached(threshold=0.95, skip={REPORT_ERROR_MESSAGE}, exclude={"client"})
+async def generate_analysis_report(context: str, query: str, extra_instructions: str = "", client=None) -> str:
+    """
+    Generate the analysis report with GPT-4o. Pass the run's AsyncOpenAI `client`;
+    without one a temporary client is created and closed.
+    """
     try:
-        # Using OpenAI's ChatCompletion via the OpenAI package
-        from openai import OpenAI
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), project="proj_q0KFYLlNxkE81QCA7dmJjacF")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a professional data analyst."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=800
-        )
+        async with openai_client_scope(client) as client:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=build_report_messages(context, query, extra_instructions),
+                temperature=0.7,
+                max_tokens=800
+            )
         report = response.choices[0].message.content.strip()
         return report
     except Exception as e:
         logging.error("Error generating analysis report: " + str(e))
-        return "Error generating report."
+        return REPORT_ERROR_MESSAGE
 
-def generate_report_for_query(query: str, extra_instructions: str = "") -> str:
+async def build_report_context_async(query: str, tags: Optional[List[str]] = None) -> str:
     """
-    Orchestrates the report generation process:
-      1. Extract tags from the query.
+    Gathers the article context for a report:
+      1. Extract tags from the query (unless precomputed `tags` are given).
       2. Query the database for articles with matching tags.
       3. Supplement data if the number of articles is below a threshold.
          - Append any newly fetched articles to the database.
-      4. Collate article summaries.
-      5. Generate a detailed analysis report using OpenAI.
-    Returns the final report as a string.
+      4. Collate article summaries (concurrently with the database append).
+    The blocking model, database and scraping calls run in worker threads, so this can be
+    awaited alongside other work (e.g. dynamic instruction generation).
+    Returns the collated context, or an empty string if no articles were found.
     """
-    logging.info("Generating report for query: " + query)
-    
     # Step 1: Extract tags from the query
-    tags = extract_tags(query)
+    if tags is None:
+        tags = await asyncio.to_thread(extract_tags, query)
     logging.info("Extracted tags: " + ", ".join(tags))
     
-    # Step 2: Query the database for articles matching the tags
-    articles_from_db = query_database_by_tags(tags)
+    # Step 2: Query the database for articles matching the tags, best matches first
+    articles_from_db = await asyncio.to_thread(query_database_by_tags, tags)
+    articles_from_db.sort(key=lambda article: len(set(article.get("tags") or []) & set(tags)), reverse=True)
     logging.info(f"Found {len(articles_from_db)} articles in the database with matching tags.")
     
     # Step 3: Supplement data if needed
-    if len(articles_from_db) < MIN_ARTICLE_THRESHOLD:
-        logging.info("Not enough articles in the database. Supplementing data...")
-        supplementary_articles = supplement_data(query, num_results=5)
-        # Avoid duplicates by filtering out articles with URLs already in the database
-        existing_urls = set(article["url"] for article in articles_from_db)
-        # Filter out articles with invalid URLs (e.g., those not starting with "http")
-        supplementary_articles = [
-            article for article in supplementary_articles 
-            if article.get("url", "").startswith("http") and article["url"] not in existing_urls
-        ]
-        
-        # Ensure each supplemental article has "query" and "tags" set
-        for article in supplementary_articles:
-            if not article.get("query"):
-                article["query"] = query
-            if not article.get("tags"):
-                article["tags"] = tags
-        
-        # Append the new supplemental articles to the database
-        if supplementary_articles:
-            logging.info("Appending supplemental articles to the database...")
-            append_articles(supplementary_articles)
-            
-        articles = articles_from_db + supplementary_articles
-    else:
-        articles = articles_from_db
+    if len(articles_from_db) >= MIN_ARTICLE_THRESHOLD:
+        return await asyncio.to_thread(collate_article_summaries, articles_from_db)
+
+    logging.info("Not enough articles in the database. Supplementing data...")
+    supplementary_articles = await asyncio.to_thread(supplement_data, query, 5)
+    # Avoid duplicates by filtering out articles with URLs already in the database
+    existing_urls = set(article["url"] for article in articles_from_db)
+    # Filter out articles with invalid URLs (e.g., those not starting with "http")
+    supplementary_articles = [
+        article for article in supplementary_articles 
+        if article.get("url", "").startswith("http") and article["url"] not in existing_urls
+    ]
+    
+    # Ensure each supplemental article has "query" and "tags" set
+    for article in supplementary_articles:
+        if not article.get("query"):
+            article["query"] = query
+        if not article.get("tags"):
+            article["tags"] = tags
     
+    articles = articles_from_db + supplementary_articles
     if not articles:
-        return "No relevant articles found to generate a report."
+        return ""
     
-    # Step 4: Collate the article summaries into context text
-    context = collate_article_summaries(articles)
+    async def store_new_articles():
+        # Append the new supplemental articles; URLs already stored are skipped by the insert
+        if supplementary_articles:
+            logging.info("Appending supplemental articles to the database...")
+            await asyncio.to_thread(append_articles, supplementary_articles)
     
-    # Step 5: Generate the detailed report using OpenAI
-    report = generate_analysis_report(context, query, extra_instructions)
-    return report
+    # Step 4: Collate the article summaries while the new articles are written
+    context, _ = await asyncio.gather(
+        asyncio.to_thread(collate_article_summaries, articles),
+        store_new_articles()
+    )
+    return context
+
+def build_report_context(query: str, tags: Optional[List[str]] = None) -> str:
+    """
+    Synchronous wrapper around build_report_context_async.
+    """
+    return asyncio.run(build_report_context_async(query, tags))
+
+async def _generate_reports_async(queries: List[str], extra_instructions: str = "") -> List[str]:
+    reports = []
+    # One OpenAI client per run, closed before the event loop ends
+    async with create_async_openai_client() as client:
+        for single_query, tags in zip(queries, await asyncio.to_thread(extract_tags_batch, queries)):
+            logging.info("Generating report for query: " + single_query)
+            context = await build_report_context_async(single_query, tags=tags)
+            if not context:
+                reports.append(NO_ARTICLES_MESSAGE)
+                continue
+            reports.append(await generate_analysis_report(context, single_query, extra_instructions, client=client))
+    return reports
+
+def generate_report_for_query(query: Union[str, List[str]], extra_instructions: str = "") -> Union[str, List[str]]:
+    """
+    Orchestrates the report generation process:
+      1. Gather the article context with build_report_context_async.
+      2. Generate a detailed analysis report using OpenAI.
+    Accepts a single query or a list of queries; for a list, tags for all queries are
+    extracted in one batched call and a list of reports is returned in the same order.
+    Returns the final report as a string (or list of strings).
+    """
+    if isinstance(query, str):
+        return generate_report_for_query([query], extra_instructions)[0]
+    return asyncio.run(_generate_reports_async(query, extra_instructions))
+
+def submit_report_batch(queries: List[str], jsonl_path: str = "report_batch.jsonl", extra_instructions: str = "") -> str:
+    """
+    Submit report generation for many queries through the OpenAI Batch API (50% cheaper,
+    results within 24h). Gathers each query's context, writes one chat completion request
+    per query to `jsonl_path` (custom_id = query index), uploads it and creates the batch.
+    Returns the batch ID; results can be retrieved later with client.batches.retrieve.
+    """
+    from openai import OpenAI
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for i, (query, tags) in enumerate(zip(queries, extract_tags_batch(queries))):
+            context = build_report_context(query, tags=tags)
+            if not context:
+                logging.info(f"Skipping query with no articles: {query}")
+                continue
+            request = {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": "gpt-4o",
+                    "messages": build_report_messages(context, query, extra_instructions),
+                    "temperature": 0.7,
+                    "max_tokens": 800
+                }
+            }
+            f.write(json.dumps(request) + "\n")
+
+    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), project="proj_q0KFYLlNxkE81QCA7dmJjacF")
+    with open(jsonl_path, "rb") as f:
+        batch_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logging.info(f"Submitted report batch {batch.id} for {len(queries)} queries.")
+    return batch.id
 
 
 
 # Optional: Main block for testing
 if __name__ == "__main__":
+    # Configure logging (records are written to the console by a background listener thread).
+    # Only done when run as a script, so importing this module leaves the host's logging alone.
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    setup_queue_logging(console_handler)
+    
     sample_query = input("Enter your query for report generation: ").strip()
     report = generate_report_for_query(sample_query)
     print("\nGenerated Report:\n")
@@ -0,0 +1,211 @@
+# File: semantic_cache.py
+
+import os
+import json
+import asyncio
+import hashlib
+import inspect
+import time
+import logging
+import threading
+from functools import wraps
+
+import httpx
+import numpy as np
+from openai import OpenAI
+
+# Directory where cached responses are persisted between runs
+CACHE_DIR = os.path.expanduser(os.getenv("REPORT_AGENT_CACHE_DIR", "~/.cache/report_agent"))
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Entries kept per cache; the oldest are evicted first
+MAX_ENTRIES = int(os.getenv("REPORT_AGENT_CACHE_MAX_ENTRIES", "500"))
+
+# -------------------------------
+# Class: SemanticCache
+# -------------------------------
+class SemanticCache:
+    """
+    Disk-backed cache of LLM responses keyed by the embedding of a query.
+
+    Every entry stores a normalized query embedding, a digest of the other call inputs
+    (e.g. the report context), the response and the time it was added. A lookup is a hit
+    when an entry with the same digest has a cosine similarity of at least `threshold`
+    with the new query and, if `max_age` (seconds) is set, is not older than that.
+    At most `max_entries` entries are kept; expired and surplus entries are dropped
+    whenever the cache is written.
+    """
+    def __init__(self, name: str, threshold: float = 0.95, cache_dir: str = CACHE_DIR, max_age: float = None,
+                 max_entries: int = MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.embeddings_path = os.path.join(cache_dir, f"{name}.npy")
+        self.entries_path = os.path.join(cache_dir, f"{name}.json")
+        self._lock = threading.Lock()
+        self._client = None
+        self._embeddings = None
+        self._entries = None
+
+    def _get_client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                project="proj_q0KFYLlNxkE81QCA7dmJjacF",
+                http_client=httpx.Client(http2=True)
+            )
+        return self._client
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        try:
+            self._embeddings = np.load(self.embeddings_path)
+            with open(self.entries_path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+            if len(self._entries) != len(self._embeddings):
+                raise ValueError("embeddings and entries are out of sync")
+        except FileNotFoundError:
+            self._embeddings = None
+            self._entries = []
+        except Exception as e:
+            logging.error(f"Discarding unreadable semantic cache {self.entries_path}: {e}")
+            self._embeddings = None
+            self._entries = []
+
+    def _prune(self):
+        """
+        Drop expired entries and evict the oldest ones beyond `max_entries`.
+        Entries are appended in time order, so the oldest come first.
+        """
+        keep = len(self._entries)
+        start = max(0, keep - self.max_entries)
+        if self.max_age is not None:
+            oldest = time.time() - self.max_age
+            while start < keep and self._entries[start].get("timestamp", 0) < oldest:
+                start += 1
+        if start:
+            self._entries = self._entries[start:]
+            self._embeddings = self._embeddings[start:]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.entries_path), exist_ok=True)
+        np.save(self.embeddings_path, self._embeddings)
+        with open(self.entries_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embed the text and return a unit-length float32 vector.
+        """
+        response = self._get_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+        embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    def lookup(self, embedding: np.ndarray, digest: str = ""):
+        """
+        Return the cached response closest to the embedding, or None if no entry with a
+        matching digest clears the similarity threshold.
+        """
+        with self._lock:
+            self._load()
+            if not self._entries:
+                return None
+            scores = self._embeddings @ embedding
+            oldest = time.time() - self.max_age if self.max_age is not None else None
+            for idx in np.argsort(-scores):
+                if scores[idx] < self.threshold:
+                    break
+                entry = self._entries[idx]
+                if oldest is not None and entry.get("timestamp", 0) < oldest:
+                    continue
+                if entry["digest"] == digest:
+                    return entry["response"]
+        return None
+
+    def add(self, embedding: np.ndarray, response, digest: str = "") -> None:
+        """
+        Store a new (embedding, response) pair, drop expired and surplus entries and
+        persist the cache to disk. The response may be any JSON-serializable value.
+        """
+        with self._lock:
+            self._load()
+            row = embedding[np.newaxis, :]
+            self._embeddings = row if self._embeddings is None else np.vstack([self._embeddings, row])
+            self._entries.append({"digest": digest, "response": response, "timestamp": time.time()})
+            self._prune()
+            try:
+                self._save()
+            except Exception as e:
+                logging.error(f"Error persisting semantic cache: {e}")
+
+def make_digest(value) -> str:
+    """
+    SHA-256 digest of a JSON-serializable value, used to match the non-embedded inputs.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# -------------------------------
+# Decorator: semantic_cached
+# -------------------------------
+def semantic_cached(threshold: float = 0.95, key_arg: str = "query", skip=(), exclude=()):
+    """
+    Cache a function's responses in a SemanticCache named after the function.
+
+    The `key_arg` argument is embedded for the similarity search; all other arguments,
+    except those named in `exclude` (e.g. API clients), are hashed with SHA-256 and must
+    match exactly. Responses listed in `skip` (e.g. fallback strings returned on errors)
+    are never stored. Coroutine functions are supported; their embedding request and
+    the cache's disk I/O run in a worker thread.
+    """
+    def decorator(func):
+        cache = SemanticCache(func.__name__, threshold=threshold)
+        signature = inspect.signature(func)
+
+        def prepare(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            others = {k: v for k, v in bound.arguments.items() if k != key_arg and k not in exclude}
+            return bound.arguments[key_arg], make_digest(others)
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                query, digest = prepare(args, kwargs)
+                try:
+                    embedding = await asyncio.to_thread(cache.embed, query)
+                except Exception as e:
+                    logging.error(f"Semantic cache unavailable for {func.__name__}: {e}")
+                    return await func(*args, **kwargs)
+
+                cached = await asyncio.to_thread(cache.lookup, embedding, digest)
+                if cached is not None:
+                    logging.info(f"Semantic cache hit for {func.__name__}.")
+                    return cached
+
+                response = await func(*args, **kwargs)
+                if response not in skip:
+                    await asyncio.to_thread(cache.add, embedding, response, digest)
+                return response
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                query, digest = prepare(args, kwargs)
+                try:
+                    embedding = cache.embed(query)
+                except Exception as e:
+                    logging.error(f"Semantic cache unavailable for {func.__name__}: {e}")
+                    return func(*args, **kwargs)
+
+                cached = cache.lookup(embedding, digest)
+                if cached is not None:
+                    logging.info(f"Semantic cache hit for {func.__name__}.")
+                    return cached
+
+                response = func(*args, **kwargs)
+                if response not in skip:
+                    cache.add(embedding, response, digest)
+                return response
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -1,26 +1,187 @@
 # File: utilities.py
 
-from typing import List
+from typing import List, Set
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor, execute_values  # For dict-style results and efficient bulk insertion
+import threading
+import io
+import queue
+import atexit
+import logging
+import logging.handlers
+import httpx
+import torch
+from contextlib import contextmanager, asynccontextmanager
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import RealDictCursor  # For dict-style results
 from keybert import KeyBERT
+from openai import AsyncOpenAI
+
+# Database details are taken from environment variables or default values
+DB_NAME = os.getenv("DB_NAME", "agentic_analysis")
+DB_USER = os.getenv("DB_USER", "jay")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_POOL_MAX_CONNECTIONS = 16
+
+# Connection pool shared by all database helpers, created on first use
+_DB_POOL = None
+_DB_POOL_LOCK = threading.Lock()
+
+# Listener that forwards queued log records to the real handlers (see setup_queue_logging)
+_LOG_LISTENER = None
+
+# -------------------------------
+# Function: setup_queue_logging
+# -------------------------------
+def setup_queue_logging(*handlers: logging.Handler, level: int = logging.INFO, filters=()) -> None:
+    """
+    Route all root logger output through a QueueHandler so logging calls on the hot path
+    only enqueue the record. A background QueueListener thread hands the records to
+    `handlers` (formatting, stream and file writes happen there).
+    `filters` are added to the QueueHandler, so they run in the thread that logs the record.
+    Calling it again replaces the previous handlers.
+    """
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        _LOG_LISTENER.stop()
+    else:
+        atexit.register(lambda: _LOG_LISTENER.stop())
+    log_queue = queue.SimpleQueue()
+    _LOG_LISTENER = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _LOG_LISTENER.start()
+    root = logging.getLogger()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for log_filter in filters:
+        queue_handler.addFilter(log_filter)
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+# -------------------------------
+# Function: create_async_openai_client
+# -------------------------------
+def create_async_openai_client() -> AsyncOpenAI:
+    """
+    Create an AsyncOpenAI client using HTTP/2. Use it as `async with create_async_openai_client() as client:`
+    so its pooled connections are closed when the run (and its event loop) ends.
+    """
+    return AsyncOpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        project="proj_q0KFYLlNxkE81QCA7dmJjacF",
+        http_client=httpx.AsyncClient(http2=True)
+    )
+
+@asynccontextmanager
+async def openai_client_scope(client: AsyncOpenAI = None):
+    """
+    Yield `client` if given; otherwise a new client that is closed on exit.
+    """
+    if client is not None:
+        yield client
+        return
+    async with create_async_openai_client() as new_client:
+        yield new_client
+
+# KeyBERT model shared by all extract_tags calls, loaded on first use
+_KW_MODEL = None
+_KW_MODEL_LOCK = threading.Lock()
+
+# Dynamically quantize the KeyBERT encoder to int8 when running on CPU
+KEYBERT_QUANTIZE = os.getenv("KEYBERT_QUANTIZE", "1") == "1"
+
+def _quantize_kw_model(kw_model: KeyBERT) -> KeyBERT:
+    """
+    Replace the Linear layers of KeyBERT's SentenceTransformer encoder with int8
+    dynamically quantized versions (CPU only).
+    """
+    try:
+        transformer = kw_model.model.embedding_model[0]
+        transformer.auto_model = torch.quantization.quantize_dynamic(
+            transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    except Exception as e:
+        print(f"KeyBERT quantization skipped: {e}")
+    return kw_model
+
+def _get_kw_model() -> KeyBERT:
+    global _KW_MODEL
+    if _KW_MODEL is None:
+        with _KW_MODEL_LOCK:
+            if _KW_MODEL is None:
+                kw_model = KeyBERT('all-MiniLM-L6-v2')
+                if KEYBERT_QUANTIZE and not torch.cuda.is_available():
+                    kw_model = _quantize_kw_model(kw_model)
+                _KW_MODEL = kw_model
+    return _KW_MODEL
+
+# Minimum KeyBERT relevance score for a keyword to be kept as a tag
+TAG_SCORE_THRESHOLD = 0.2
 
 # -------------------------------
 # Function: extract_tags
 # -------------------------------
-def extract_tags(query: str, top_n: int = 5):
+def extract_tags(query: str, top_n: int = 5, kw_model: KeyBERT = None):
     """
     Extract tags from the input query using KeyBERT.
+    Uses the shared KeyBERT model unless `kw_model` is given.
     Returns a list of keywords (tags).
     """
-    kw_model = KeyBERT('all-MiniLM-L6-v2')
+    return extract_tags_batch([query], top_n=top_n, kw_model=kw_model)[0]
+
+# -------------------------------
+# Function: extract_tags_batch
+# -------------------------------
+def extract_tags_batch(queries: List[str], top_n: int = 5, kw_model: KeyBERT = None) -> List[List[str]]:
+    """
+    Extract tags for several queries at once. All queries are passed to KeyBERT in one
+    call, so the sentence embeddings are computed in a single batched encoder pass.
+    Returns one list of keywords (tags) per query, in input order.
+    """
+    if not queries:
+        return []
+    kw_model = kw_model or _get_kw_model()
     # Use a stricter ngram range to get more focused tags
-    keywords = kw_model.extract_keywords(query, keyphrase_ngram_range=(1, 1), stop_words='english', top_n=top_n)
-    # Optionally, filter further by setting a score threshold
-    threshold = 0.2
-    filtered_keywords = [kw for kw, score in keywords if score > threshold]
-    return filtered_keywords
+    keywords = kw_model.extract_keywords(queries, keyphrase_ngram_range=(1, 1), stop_words='english', top_n=top_n)
+    # KeyBERT returns a flat list (not a list of lists) when given a single document
+    if len(queries) == 1:
+        keywords = [keywords]
+    # ...and a bare [] when its vectorizer cannot be fitted (e.g. only stop words)
+    if len(keywords) != len(queries):
+        keywords = [[] for _ in queries]
+    # Filter further by a minimum score threshold
+    return [[kw for kw, score in query_keywords if score > TAG_SCORE_THRESHOLD] for query_keywords in keywords]
+
+# -------------------------------
+# Function: get_conn
+# -------------------------------
+def _get_db_pool() -> ThreadedConnectionPool:
+    global _DB_POOL
+    if _DB_POOL is None:
+        with _DB_POOL_LOCK:
+            if _DB_POOL is None:
+                _DB_POOL = ThreadedConnectionPool(
+                    1, DB_POOL_MAX_CONNECTIONS,
+                    dbname=DB_NAME, user=DB_USER, host=DB_HOST, port=DB_PORT
+                )
+    return _DB_POOL
+
+@contextmanager
+def get_conn():
+    """
+    Borrow a PostgreSQL connection from the shared pool for the duration of a `with` block.
+    Any transaction left open is rolled back before the connection is returned;
+    broken connections are discarded instead of being reused.
+    """
+    pool = _get_db_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        pool.putconn(conn, close=bool(conn.closed))
 
 # -------------------------------
 # Function: check_duplicate_article
@@ -29,33 +190,40 @@ def check_duplicate_article(url: str) -> bool:
     """
     Check whether an article with the given URL already exists in the PostgreSQL database.
     
-    Database details are taken from environment variables or default values:
-      - DB_NAME: "agent_analysis" (or "agentic_analysis" as used here)
-      - DB_USER: "jay"
-      - DB_HOST: defaults to "localhost"
-      - DB_PORT: defaults to "5432"
-    
     Returns True if a duplicate exists; otherwise, False.
     """
-    DB_NAME = os.getenv("DB_NAME", "agentic_analysis")
-    DB_USER = os.getenv("DB_USER", "jay")
-    DB_HOST = os.getenv("DB_HOST", "localhost")
-    DB_PORT = os.getenv("DB_PORT", "5432")
-    
-    conn = None
     try:
-        conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, host=DB_HOST, port=DB_PORT)
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM articles WHERE url = %s", (url,))
-        result = cur.fetchone()
-        cur.close()
-        return result is not None
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM articles WHERE url = %s", (url,))
+            result = cur.fetchone()
+            cur.close()
+            return result is not None
     except Exception as e:
         print(f"Error checking duplicate for URL {url}: {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
+
+# -------------------------------
+# Function: check_duplicates
+# -------------------------------
+def check_duplicates(urls: List[str]) -> Set[str]:
+    """
+    Batched form of check_duplicate_article: look up all URLs with a single query.
+    
+    Returns the set of URLs that already exist in the database.
+    """
+    if not urls:
+        return set()
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT url FROM articles WHERE url = ANY(%s)", (list(urls),))
+            existing = {row[0] for row in cur.fetchall()}
+            cur.close()
+            return existing
+    except Exception as e:
+        print(f"Error checking duplicates for {len(urls)} URLs: {e}")
+        return set()
 
 # -------------------------------
 # Function: query_database_by_tags
@@ -64,8 +232,8 @@ def query_database_by_tags(query_tags: List[str], min_matches: int = 4) -> List[
     """
     Query the PostgreSQL database for articles with overlapping tags.
     
-    It retrieves articles where the 'tags' column overlaps with the provided list using the PostgreSQL '&&' operator.
-    Then, it filters the results to only include articles that have at least `min_matches` matching tags with the query_tags.
+    It retrieves articles where the 'tags' column overlaps with the provided list using the PostgreSQL '&&' operator
+    and that have at least `min_matches` tags in common with query_tags. Both conditions are evaluated in SQL.
     
     Returns a list of dictionaries containing:
         - url
@@ -74,40 +242,45 @@ def query_database_by_tags(query_tags: List[str], min_matches: int = 4) -> List[
         - tags
         - retrieval_timestamp
     """
-    import os
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-
-    DB_NAME = os.getenv("DB_NAME", "agentic_analysis")
-    DB_USER = os.getenv("DB_USER", "jay")
-    DB_HOST = os.getenv("DB_HOST", "localhost")
-    DB_PORT = os.getenv("DB_PORT", "5432")
-    
-    conn = None
     results = []
     try:
-        conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, host=DB_HOST, port=DB_PORT)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        # First, fetch articles with any overlapping tags using the && operator
-        cur.execute("SELECT url, summary, query, tags, retrieval_timestamp FROM articles WHERE tags && %s", (query_tags,))
-        rows = cur.fetchall()
-        cur.close()
-        # Now, filter articles to require at least `min_matches` common tags.
-        for row in rows:
-            article_tags = set(row.get("tags", []))
-            common_tags = article_tags.intersection(query_tags)
-            if len(common_tags) >= min_matches:
-                results.append(dict(row))
+        with get_conn() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            # The && overlap test can use the GIN index; the intersection count enforces min_matches
+            cur.execute(
+                """
+                SELECT url, summary, query, tags, retrieval_timestamp FROM articles
+                WHERE tags && %s::text[]
+                  AND cardinality(ARRAY(SELECT UNNEST(tags) INTERSECT SELECT UNNEST(%s::text[]))) >= %s
+                """,
+                (query_tags, query_tags, min_matches)
+            )
+            results = [dict(row) for row in cur.fetchall()]
+            cur.close()
     except Exception as e:
         print(f"Error querying database by tags: {e}")
-    finally:
-        if conn:
-            conn.close()
     return results
 
 # -------------------------------
 # Function: append_articles
 # -------------------------------
+def _copy_field(value) -> str:
+    """
+    Format a value for PostgreSQL's text COPY format (None becomes NULL).
+    """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def _array_literal(items) -> str:
+    """
+    Format a list of strings as a PostgreSQL array literal, e.g. {"Trump","Tariff"}.
+    """
+    if items is None:
+        return None
+    quoted = ['"' + str(item).replace("\\", "\\\\").replace('"', '\\"') + '"' for item in items]
+    return "{" + ",".join(quoted) + "}"
+
 def append_articles(articles: List[dict]) -> None:
     """
     Append new articles to the PostgreSQL database.
@@ -117,44 +290,45 @@ def append_articles(articles: List[dict]) -> None:
         - summary: str
         - query: str
         - tags: list of str
-    The function inserts articles into the 'articles' table using an "ON CONFLICT DO NOTHING" clause
-    to avoid inserting duplicate entries (based on the unique URL).
+    The rows are streamed with COPY into a temporary staging table, then moved into the
+    'articles' table using an "ON CONFLICT DO NOTHING" clause to avoid inserting
+    duplicate entries (based on the unique URL).
     """
-    DB_NAME = os.getenv("DB_NAME", "agentic_analysis")
-    DB_USER = os.getenv("DB_USER", "jay")
-    DB_HOST = os.getenv("DB_HOST", "localhost")
-    DB_PORT = os.getenv("DB_PORT", "5432")
-    
-    conn = None
+    if not articles:
+        return
     try:
-        conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, host=DB_HOST, port=DB_PORT)
-        cur = conn.cursor()
-        insert_query = """
-            INSERT INTO articles (url, summary, query, tags)
-            VALUES %s
-            ON CONFLICT (url) DO NOTHING;
-        """
-        # Prepare the data as a list of tuples
-        data_tuples = []
-        for article in articles:
-            url = article.get("url")
-            summary = article.get("summary")
-            query_text = article.get("query")
-            tags = article.get("tags")
-            data_tuples.append((url, summary, query_text, tags))
-        
-        # Use execute_values for bulk insertion
-        execute_values(cur, insert_query, data_tuples)
-        conn.commit()
-        print(f"Successfully appended {len(articles)} articles to the database.")
-        cur.close()
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                CREATE TEMP TABLE articles_stage (url TEXT, summary TEXT, query TEXT, tags TEXT[])
+                ON COMMIT DROP;
+            """)
+            # Prepare the data as tab-separated COPY rows
+            buf = io.StringIO()
+            for article in articles:
+                row = (
+                    article.get("url"),
+                    article.get("summary"),
+                    article.get("query"),
+                    _array_literal(article.get("tags")),
+                )
+                buf.write("\t".join(_copy_field(value) for value in row) + "\n")
+            buf.seek(0)
+            
+            # Use COPY for bulk loading, then a single set-based insert
+            cur.copy_expert("COPY articles_stage (url, summary, query, tags) FROM STDIN", buf)
+            cur.execute("""
+                INSERT INTO articles (url, summary, query, tags)
+                SELECT url, summary, query, tags FROM articles_stage
+                ON CONFLICT (url) DO NOTHING;
+            """)
+            appended = cur.rowcount
+            conn.commit()
+            print(f"Successfully appended {appended} of {len(articles)} articles to the database.")
+            cur.close()
     except Exception as e:
+        # get_conn rolls back any uncommitted changes
         print(f"Error appending articles: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            conn.close()
 
 # -------------------------------
 # Optional: Test the functions when run as a script
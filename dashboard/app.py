@@ -3,37 +3,151 @@
 import streamlit as st
 import os
 import sys
-import threading
 import time
-import queue  # For thread-safe communication
+import queue
+import threading
+from collections import deque
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Add the Core_Workflow directory to the import path (once; the script reruns on every interaction)
+core_workflow_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Core_Workflow'))
+if core_workflow_path not in sys.path:
+    sys.path.insert(0, core_workflow_path)
+
+from agent_langchain import submit_agent, drain_queue, is_failed_output, LOG_BUFFER_LINES, TOKEN_BUFFER_SIZE
+
+# Seconds a finished report is reused for a repeated query (across sessions and reloads)
+REPORT_CACHE_TTL = 3600
+
+@st.cache_resource
+def get_report_cache() -> dict:
+    """
+    Process-wide store of finished reports: normalized query -> (timestamp, report).
+    """
+    return {}
+
+@st.cache_resource
+def get_report_cache_lock() -> threading.Lock:
+    return threading.Lock()
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+def get_cached_report(query: str):
+    """
+    Return the cached report for the query if it is younger than REPORT_CACHE_TTL, else None.
+    """
+    entry = get_report_cache().get(normalize_query(query))
+    if entry and time.time() - entry[0] < REPORT_CACHE_TTL:
+        return entry[1]
+    return None
+
+def cache_report(query: str, report: str) -> None:
+    """
+    Store a finished report for the query, dropping entries older than REPORT_CACHE_TTL.
+    Failed runs (error or no-articles reports) are not stored.
+    """
+    if is_failed_output(report):
+        return
+    cache = get_report_cache()
+    now = time.time()
+    with get_report_cache_lock():
+        for key in [key for key, (timestamp, _) in cache.items() if now - timestamp >= REPORT_CACHE_TTL]:
+            del cache[key]
+        cache[normalize_query(query)] = (now, report)
+
+class SessionCancelEvent(threading.Event):
+    """
+    Cancellation token for an agent job. Besides being set explicitly, it reports itself
+    as set once the browser session that started the job is no longer connected.
+    """
+    def __init__(self, session_id: str):
+        super().__init__()
+        self.session_id = session_id
+    
+    def is_set(self) -> bool:
+        if not super().is_set() and not runtime.get_instance().is_active_session(self.session_id):
+            self.set()
+        return super().is_set()
+
+def collect_job_result(job: dict) -> None:
+    """
+    Store the report (or error) of a finished agent job in the session state. This runs
+    in the script thread: the agent's worker thread only completes the job's future, so
+    the pool threads shared by all sessions never touch a session's state.
+    """
+    future = job["future"]
+    error = future.exception()
+    if error is None:
+        report = future.result()
+        cache_report(job["query"], report)
+    else:
+        report = None
+        st.session_state["report_error"] = str(error)
+    st.session_state["report"] = report
+    st.session_state["report_query"] = job["query"]
+
+# Seconds between refreshes of the log panel while the agent produces output
+LOG_REFRESH_SECONDS = 0.5
+# Longest a refresh waits for the next log line while the agent is quiet
+LOG_IDLE_WAIT_MAX_SECONDS = 2.0
+
+@st.fragment(run_every=LOG_REFRESH_SECONDS)
+def log_panel():
+    """
+    Show the logs of the agent running for this session. Only this fragment reruns on
+    each refresh; the full page reruns once, when the agent has finished.
 
-# Append the path to the Core_Workflow directory
-core_workflow_path = os.path.join(os.path.dirname(__file__), '..', 'Core_Workflow')
-sys.path.append(core_workflow_path)
+    While the agent is quiet, a refresh waits for the next log line instead of rendering
+    unchanged output, doubling its wait up to LOG_IDLE_WAIT_MAX_SECONDS. Streamlit merges
+    the refreshes requested meanwhile into one, so an idle panel backs off too.
+    """
+    job = st.session_state.get("job")
+    if job is None:
+        return
+    # Drain everything queued since the last refresh and render it in a single update
+    logs = drain_queue(job["log_queue"])
+    tokens = drain_queue(job["token_queue"])
+    if not logs and not tokens and not job["future"].done():
+        job["idle_wait"] = min(2 * job["idle_wait"] or LOG_REFRESH_SECONDS, LOG_IDLE_WAIT_MAX_SECONDS)
+        try:
+            logs.append(job["log_queue"].get(timeout=job["idle_wait"]))
+        except queue.Empty:
+            pass
+        logs.extend(drain_queue(job["log_queue"]))
+        tokens = drain_queue(job["token_queue"])
+    if logs or tokens:
+        job["idle_wait"] = 0.0
+    job["logs"].extend(logs)
+    job["tokens"].extend(tokens)
+    # Plain text rendering: no Markdown/HTML parsing of the log lines
+    st.markdown("#### Thinking...")
+    st.code("\n".join(job["logs"]), language="text")
+    # The agent's output, token by token, as the LLM generates it
+    if job["tokens"]:
+        st.markdown("".join(job["tokens"]))
+    if job["future"].done():
+        st.rerun()
 
-from agent_langchain import run_agent, get_logs
+@st.cache_resource
+def load_css() -> str:
+    with open(os.path.join(os.path.dirname(__file__), "style.css"), encoding="utf-8") as f:
+        return f.read()
 
 # Set up the Streamlit page
 st.set_page_config(page_title="AgenticAI Dashboard", layout="wide")
 
-# Custom CSS for styling
-st.markdown(
-    """
-    <style>
-    [data-testid="stSidebar"] { background-color: #add1ad; }
-    .report-box { background-color: #F5F5F5; padding: 20px; border-radius: 10px; border: 1px solid #17A2B8; }
-    .thinking-text { color: #A9A9A9; font-family: 'Courier New', Courier, monospace; }
-    hr { border: 1px solid #17A2B8; }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# Custom CSS for styling (read from disk once per process, injected on every full rerun
+# because Streamlit removes elements that a rerun does not emit again)
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
 
 # Sidebar setup
 st.sidebar.title("AgenticAI Control Panel")
 query_input = st.sidebar.text_input("Enter your query", "Analyze the DPZ stock, should I buy it in Feb 2025?")
 if st.sidebar.button("Generate Report", key="generate", help="Click to analyze"):
     st.session_state["query"] = query_input
+    st.session_state.pop("report_query", None)  # Resubmitting retries a failed report
 
 # Main dashboard title with teal color
 st.markdown('<h1 style="color: #17A2B8;">AgenticAI Report Dashboard</h1>', unsafe_allow_html=True)
@@ -44,45 +158,48 @@ if "query" in st.session_state:
     query = st.session_state["query"]
     st.markdown(f'<h3 style="color: #17A2B8;">Report for: {query}</h3>', unsafe_allow_html=True)
     
-    # Placeholder for real-time log updates
-    thinking_container = st.empty()
+    # Start the agent in the background when a new query was submitted. Reruns triggered
+    # by other widgets reuse the job or the report stored in the session.
+    job = st.session_state.get("job")
+    if st.session_state.get("report_query") != query and (job is None or job["query"] != query):
+        # Stop the agent still working on a previous query of this session
+        if job is not None:
+            job["cancel"].set()
+            del st.session_state["job"]
+        report = get_cached_report(query)
+        if report is not None:
+            st.session_state["report"] = report
+            st.session_state["report_query"] = query
+        else:
+            ctx = get_script_run_ctx()
+            job = {
+                "query": query, "logs": deque(maxlen=LOG_BUFFER_LINES), "idle_wait": 0.0,
+                "tokens": deque(maxlen=TOKEN_BUFFER_SIZE),
+                "cancel": SessionCancelEvent(ctx.session_id),
+                # Each job gets its own queues, so concurrent and replaced runs don't mix
+                "log_queue": queue.Queue(maxsize=LOG_BUFFER_LINES),
+                "token_queue": queue.Queue(maxsize=TOKEN_BUFFER_SIZE)
+            }
+            st.session_state["job"] = job
+            # Earlier queries of this session are given to the agent as context
+            memory = st.session_state.setdefault("agent_memory", {"recent_queries": []})
+            job["future"] = submit_agent(query, memory, job["cancel"], job["log_queue"], job["token_queue"])
     
-    # Create a queue to pass the report from the thread
-    report_queue = queue.Queue()
-    
-    # Define the function to run in the background thread
-    def generate_report():
-        try:
-            report = run_agent(query)  # Generate the report
-            report_queue.put({"status": "success", "report": report})
-        except Exception as e:
-            report_queue.put({"status": "error", "message": str(e)})
+    # Collect the result of a finished job and drop the job
+    job = st.session_state.get("job")
+    if job is not None and job["future"].done():
+        collect_job_result(job)
+        del st.session_state["job"]
     
-    # Start the background thread
-    thread = threading.Thread(target=generate_report)
-    thread.start()
-    
-    # Display logs in real-time while the thread runs
-    with st.spinner("Analyzing your query..."):
-        while thread.is_alive():
-            logs = get_logs()
-            thinking_container.markdown(
-                f'<div class="thinking-text">#### Thinking...\n{logs}</div>',
-                unsafe_allow_html=True
-            )
-            time.sleep(0.5)  # Refresh logs every half second
-    
-    # Wait for the thread to finish
-    thread.join()
-    
-    # Retrieve the result from the queue
-    result = report_queue.get()
-    if result["status"] == "success":
-        report = result["report"]
-        with st.expander("View Report", expanded=True):
-            thinking_container.markdown(
-                f'<div class="report-box">{report}</div>',
-                unsafe_allow_html=True
-            )
-    else:
-        st.error(f"Error generating report: {result['message']}")
\ No newline at end of file
+    if "job" in st.session_state:
+        log_panel()
+    elif st.session_state.get("report_query") == query:
+        report = st.session_state["report"]
+        if report is None:
+            st.error(f"Error generating report: {st.session_state['report_error']}")
+        else:
+            with st.expander("View Report", expanded=True):
+                st.markdown(
+                    f'<div class="report-box">{report}</div>',
+                    unsafe_allow_html=True
+                )